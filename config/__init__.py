@@ -1,7 +1,9 @@
 import yaml
 import sys
 import os
+import functools
 import logging
+import pickle
 
 
 def pwd():
@@ -15,8 +17,10 @@ def pwd():
     return wd
 
 
+@functools.lru_cache(maxsize=256)
 def set_path(wd, data_path):
     r"""Joins a path to the working directory.
+    Cached, the same few paths are joined many times per run.
 
     Arguments:
         wd: The path of the directory this module is in.
@@ -30,6 +34,8 @@ def set_path(wd, data_path):
 
 def setup_logging(level='INFO', fn='app.log'):
     r"""Configures the logger Level.
+    Calling it again with the same fn does not add a second handler for the same log file.
+
     Arguments:
         level: CRITICAL -> ERROR -> WARNING -> INFO -> DEBUG.
     Side effect:
@@ -39,19 +45,67 @@ def setup_logging(level='INFO', fn='app.log'):
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     ll = logging.getLevelName(level)
     logger = logging.getLogger()
-    handler = logging.FileHandler(fn, mode='a')
-    formatter = logging.Formatter(
-        "%(asctime)s %(name)-12s %(levelname)-8s"
-        "{'file': %(filename)s 'function': %(funcName)s 'line': %(lineno)s}\n"
-        "message: %(message)s\n")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    log_path = os.path.abspath(fn)
+    if not any(isinstance(h, logging.FileHandler) and h.baseFilename == log_path for h in logger.handlers):
+        handler = logging.FileHandler(fn, mode='a')
+        formatter = logging.Formatter(
+            "%(asctime)s %(name)-12s %(levelname)-8s"
+            "{'file': %(filename)s 'function': %(funcName)s 'line': %(lineno)s}\n"
+            "message: %(message)s\n")
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
     logger.setLevel(ll)
 
 
-with open('config/wnvoutbreak.yaml') as f:
-    config_dict_temp = yaml.load(f, Loader=yaml.FullLoader)
-    config_dict_temp['root'] = pwd()
+# The config is plain key value strings, use the libyaml backed safe loader when PyYAML was built with it.
+try:
+    YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    YamlLoader = yaml.SafeLoader
+
+
+def load_config(config_path, cache_path):
+    r"""Loads the config yaml.
+    The parsed yaml is pickled to cache_path with the yaml's modified time,
+    later loads read the pickle instead of parsing the yaml until the yaml is edited.
+
+    Arguments:
+        config_path: Path of the config yaml.
+        cache_path: Path of the pickle cache.
+    Returns:
+        The dictionary parsed from the config yaml.
+    """
+    mtime = os.stat(config_path).st_mtime_ns
+    # Any cache that can not be read or does not hold (mtime, config) falls back to parsing the yaml.
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_mtime, cached_config = pickle.load(f)
+        if cached_mtime == mtime:
+            return cached_config
+    except Exception:
+        pass
+
+    with open(config_path) as f:
+        config = yaml.load(f, Loader=YamlLoader)
+    # Written to a temporary file and renamed so a reader never sees a partly written cache.
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((mtime, config), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return config
+
+
+# root is not cached, it depends on the script that imports config.
+config_dict_temp = load_config('config/wnvoutbreak.yaml', 'config/wnvoutbreak.cache.pkl')
+config_dict_temp['root'] = pwd()
 
-config_dict = {key: set_path(config_dict_temp['root'], value) if key.endswith('_dir') else value for key, value in
-               config_dict_temp.items()}
+# The root is the same for every *_dir path, join its separator once and prefix it.
+# os.path.join(root, '') adds the separator only when root is not empty.
+root_with_sep = os.path.join(config_dict_temp['root'], '')
+config_dict = {}
+for key, value in config_dict_temp.items():
+    config_dict[key] = root_with_sep + value if key.endswith('_dir') else value
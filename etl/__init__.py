@@ -1 +1,4 @@
+import logging
 from .api import GSheetsEtl
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
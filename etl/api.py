@@ -1,8 +1,61 @@
 import csv
+import io
+import logging
+import os
+import shelve
+import threading
+import time
 import arcpy
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote_plus
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from config import set_path
 
+# orjson parses the geocoder responses several times faster than the standard library.
+# It is not part of the default ArcGIS Pro python environment so fall back to json when it is missing.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    RateLimiter spaces out calls shared between threads so a maximum number of calls per second is not exceeded.
+
+    Parameters:
+        rate (float): The maximum number of calls per second, 0 disables the limit.
+    """
+
+    def __init__(self, rate):
+        """RateLimiter constructor.
+
+        Args:
+            rate: The maximum number of calls per second, 0 disables the limit.
+        """
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        """Blocks until the next call is allowed.
+
+        Returns:
+            The next call slot is reserved for the calling thread.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
 
 class SpatialEtl:
     """
@@ -65,84 +118,320 @@ class GSheetsEtl(SpatialEtl):
             config_dict: A dictionary containing all the key value pairs from the config yaml.
         """
         super().__init__(config_dict)
+        # One persistent session for extract and transform, the pool is sized so every geocoder worker
+        # keeps its own keep-alive connection instead of paying a new TCP/TLS handshake per request.
+        # Transient server errors and rate limit responses are retried with exponential backoff.
+        workers = self.config_dict.get('geocoder_workers', 10)
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET', 'POST'])
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=workers, pool_maxsize=workers)
         self.s = requests.Session()
+        self.s.mount('https://', adapter)
+        self.s.mount('http://', adapter)
+        # Retry does not bound a stalled read, every request is sent with a timeout in seconds so one hung
+        # connection fails the etl instead of hanging the run.
+        self.timeout = self.config_dict.get('http_timeout', 30.0)
+        # The geocoder url template is built once, each request only formats in the quoted address.
+        self.geocoder_url = (self.config_dict['geocoder_prefix_url'] + '{}' +
+                             self.config_dict['geocoder_suffix_url']).format
+        # Number of geocoded rows between progress messages.
+        self.log_every = self.config_dict.get('log_every', 1000)
+        # Client side throttle shared by the geocoder workers, geocoder_rate_limit is in requests per second.
+        self.rate_limiter = RateLimiter(self.config_dict.get('geocoder_rate_limit', 10))
+
+    def __enter__(self):
+        """Enters the with block.
+
+        Returns:
+            The GSheetsEtl instance.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the http session when the with block exits, errors are not suppressed.
+
+        Args:
+            exc_type: The exception type raised in the with block, None if there was no error.
+            exc_value: The exception raised in the with block.
+            traceback: The traceback of the exception.
+        """
+        self.close()
+
+    def close(self):
+        """Closes the http session.
+
+        Returns:
+            The pooled connections of the session are closed.
+        """
+        self.s.close()
+
+    @staticmethod
+    def _read_addresses(lines):
+        """Reads the Address column of the address csv.
+        Only the Address column is needed, it is indexed from the header instead of building a dict per row.
+
+        Args:
+            lines: Iterable of the address csv lines.
+
+        Returns:
+            A list of the one line addresses.
+        """
+        csv_reader = csv.reader(lines, delimiter=',')
+        address_index = next(csv_reader).index('Address')
+        return [row[address_index] for row in csv_reader if row]
 
     def extract(self):
         """Extracts data from a google spreadsheet.
         Google spreadsheet url is contained in the config yaml.
+        The addresses are handed to transform in memory,
+        ./data/addresses.csv is only written when persist_intermediate is set in the config yaml.
 
         Returns:
-             ./data/addresses.csv with addresses from the google spreadsheet is created.
+             A list of the addresses from the google spreadsheet.
         """
         # Get data
         arcpy.AddMessage('Extracting addresses from google spreadsheet')
-        r = self.s.get(self.config_dict.get('gsheet_url'))
-        arcpy.AddMessage(f'HTTP Response: {r.status_code} \n {r.content} \n')
-        r.encoding = 'utf-8'
-        data = r.text
+        r = self.s.get(self.config_dict.get('gsheet_url'), timeout=self.timeout)
+        arcpy.AddMessage(f'HTTP Response: {r.status_code}\n')
+        data = r.content
 
-        # Write data to csv
-        csv_path = set_path(self.config_dict['etl_dir'], 'addresses.csv')
-        arcpy.AddMessage(f'Writing data to addresses.csv in {csv_path}\n')
-        with open(csv_path, 'w', encoding='utf-8') as f:
-            f.write(data)
+        # Write the raw bytes to csv for debugging, they are never decoded to a str and re-encoded.
+        if self.config_dict.get('persist_intermediate', False):
+            csv_path = set_path(self.config_dict['etl_dir'], 'addresses.csv')
+            arcpy.AddMessage(f'Writing data to addresses.csv in {csv_path}\n')
+            with open(csv_path, 'wb') as f:
+                f.write(data)
 
-    def transform(self):
-        """Transforms addresses.csv
-        Transforms addresses.csv to new_addresses.csv by adding geocoded x, y coordinates to new_addresses.csv.
+        return self._read_addresses(io.StringIO(data.decode('utf-8'), newline=''))
+
+    def _geocode(self, address):
+        """Geocodes a single address with the geocoder in the config yaml.
+
+        Args:
+            address: The one line address to geocode.
+
+        Returns:
+            A tuple with the geocoded x, y coordinates of the address.
+        """
+        url = self.geocoder_url(quote_plus(address))
+        self.rate_limiter.wait()
+        r = self.s.get(url, timeout=self.timeout)
+        resp_dict = json_loads(r.content)
+        coordinates = resp_dict['result']['addressMatches'][0]['coordinates']
+        return coordinates['x'], coordinates['y']
+
+    def _geocode_batch(self, addresses):
+        """Geocodes a list of addresses with the Census batch geocoder in the config yaml.
+        Each request uploads up to 10,000 addresses as a csv, city and state are taken from the config yaml.
+
+        Args:
+            addresses: The one line addresses to geocode.
 
         Returns:
-            ./data/new_addresses.csv with geocoded x, y coordinates for use with arcpy.
+            A list with a tuple of the geocoded x, y coordinates for each address, in the same order as addresses.
+            An address the geocoder could not match is None.
+        """
+        batch_url = self.config_dict['geocoder_batch_url']
+        city = self.config_dict.get('geocoder_batch_city', '')
+        state = self.config_dict.get('geocoder_batch_state', '')
+        benchmark = self.config_dict.get('geocoder_batch_benchmark', 'Public_AR_Current')
+        # A batch of 10,000 addresses takes minutes to geocode, it has its own timeout.
+        batch_timeout = self.config_dict.get('geocoder_batch_timeout', 600.0)
+        batch_size = 10000
+        coordinates = {}
+        for start in range(0, len(addresses), batch_size):
+            # Batch input columns: Unique ID, Street address, City, State, ZIP
+            address_file = io.StringIO()
+            writer = csv.writer(address_file)
+            writer.writerows((i, address, city, state, '') for i, address in
+                             enumerate(addresses[start:start + batch_size], start))
+            arcpy.AddMessage(f'Batch geocoding addresses {start} to {min(start + batch_size, len(addresses))}')
+            self.rate_limiter.wait()
+            r = self.s.post(batch_url, files={'addressFile': ('addresses.csv', address_file.getvalue())},
+                            data={'benchmark': benchmark}, timeout=batch_timeout)
+            r.raise_for_status()
+
+            # The results are not returned in input order, they are matched back up by the unique id.
+            # Result columns: id, address, match, match type, matched address, "x,y", tiger line id, side
+            # Unmatched rows only have the first three columns.
+            for row in csv.reader(io.StringIO(r.text)):
+                if len(row) > 5 and row[2] == 'Match':
+                    x, y = row[5].split(',')
+                    coordinates[int(row[0])] = (float(x), float(y))
+        return [coordinates.get(i) for i in range(len(addresses))]
+
+    def _geocoded_rows(self, addresses, cache, executor):
+        """Geocodes addresses and yields the transformed rows.
+        Geocoded coordinates are cached by normalized address so reruns skip the geocoder,
+        the cache is only read and written from the thread consuming the rows.
+
+        Args:
+            addresses: The one line addresses to geocode.
+            cache: Open shelve of previously geocoded coordinates.
+            executor: Thread pool used to geocode the addresses that are not cached.
+
+        Returns:
+            A generator of (X, Y, Type) rows in the same order as addresses.
+        """
+        keys = [address.strip().lower() for address in addresses]
+
+        # Each distinct address that is not cached is geocoded once, in order of first appearance.
+        # Repeats of an address are read back from the cache after its first row.
+        misses = {}
+        for key, address in zip(keys, addresses):
+            if key not in misses and key not in cache:
+                misses[key] = address
+        miss_addresses = list(misses.values())
+
+        # Cache misses go to the batch geocoder when it is configured, otherwise they are geocoded
+        # one request per address on the thread pool so the round trips overlap.
+        # Either way the coordinates are returned in the same order as the misses.
+        if self.config_dict.get('geocoder_batch_url'):
+            batch_coordinates = self._geocode_batch(miss_addresses)
+            # Cache every match before failing on the unmatched addresses, a rerun only geocodes the failures.
+            unmatched = []
+            for key, address, xy in zip(misses, miss_addresses, batch_coordinates):
+                if xy is None:
+                    unmatched.append(address)
+                else:
+                    cache[key] = xy
+            if unmatched:
+                raise ValueError(f'Batch geocoder found no match for {len(unmatched)} addresses: {unmatched}')
+            coordinates = iter(batch_coordinates)
+        else:
+            coordinates = executor.map(self._geocode, miss_addresses)
+
+        # Bind the per row callables to locals once.
+        # Progress is reported every log_every rows instead of for every row.
+        next_coordinates = coordinates.__next__
+        log_every = self.log_every
+        address_count = len(addresses)
+        arcpy.AddMessage(f'Geocoding {len(misses)} distinct addresses not found in geocode cache, '
+                         f'{address_count} addresses in total')
+        for i, (address, key) in enumerate(zip(addresses, keys), 1):
+            if key in misses:
+                del misses[key]
+                x, y = next_coordinates()
+                cache[key] = (x, y)
+            else:
+                x, y = cache[key]
+            logger.debug('geocoded %s: %s, %s', address, x, y)
+            if i % log_every == 0:
+                arcpy.AddMessage(f'geocoded {i} of {address_count} addresses, last address: {address}')
+            yield x, y, 'Residential'
+
+    def transform(self, addresses=None):
+        """Transforms the extracted addresses
+        Transforms the addresses to rows of geocoded x, y coordinates.
+        Addresses are geocoded concurrently, geocoder_workers in the config yaml sets the number of requests in flight.
+        When geocoder_batch_url is set in the config yaml the addresses are sent to the batch geocoder instead.
+        Geocoded addresses are cached in ./data/geocode_cache and are not sent to the geocoder again.
+        ./data/new_addresses.csv is only written when persist_intermediate is set in the config yaml.
+        The rows are geocoded as the generator is consumed, so load inserts rows while later addresses are
+        still being geocoded. Nothing runs until the rows are consumed, process is the supported way to run the etl.
+
+        Args:
+            addresses: The addresses returned by extract, when None they are read from ./data/addresses.csv
+                which is only written by a previous run with persist_intermediate set.
+
+        Returns:
+            A generator of (X, Y, Type) rows with geocoded x, y coordinates for use with arcpy.
         """
         arcpy.AddMessage('Transforming addresses using geocoder')
 
-        # Create transformed csv with X, Y, and Type for headers
-        csv_path = set_path(self.config_dict['etl_dir'], 'addresses.csv')
-        new_csv_path = set_path(self.config_dict['etl_dir'], 'new_addresses.csv')
-        with open(new_csv_path, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ['X', 'Y', 'Type']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            with open(csv_path, 'r') as address_reader:
-                csv_dict = csv.DictReader(address_reader, delimiter=',')
-                for row in csv_dict:
-                    address = row['Address']
-                    arcpy.AddMessage(f'geocoding {address}')
-                    url = f"{self.config_dict['geocoder_prefix_url']}{address}{self.config_dict['geocoder_suffix_url']}"
-                    r = self.s.get(url)
-                    resp_dict = r.json()
-                    x = resp_dict['result']['addressMatches'][0]['coordinates']['x']
-                    y = resp_dict['result']['addressMatches'][0]['coordinates']['y']
-                    row_dict = {'X': x, 'Y': y, 'Type': 'Residential'}
-                    arcpy.AddMessage(f'Writing row to new_addresses.csv: {row_dict}')
-                    writer.writerow(row_dict)
+        # Read the addresses to geocode
+        if addresses is None:
+            csv_path = set_path(self.config_dict['etl_dir'], 'addresses.csv')
+            self._check_intermediate(csv_path)
+            with open(csv_path, 'r', newline='', encoding='utf-8') as address_reader:
+                addresses = self._read_addresses(address_reader)
 
-    def load(self):
-        """Loads new_addresss.csv into an arcpy feature class.
+        workers = self.config_dict.get('geocoder_workers', 10)
+        cache_path = set_path(self.config_dict['etl_dir'], 'geocode_cache')
+        with shelve.open(cache_path) as cache, ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = self._geocoded_rows(addresses, cache, executor)
+            if self.config_dict.get('persist_intermediate', False):
+                # Create transformed csv with X, Y, and Type for headers for debugging.
+                new_csv_path = set_path(self.config_dict['etl_dir'], 'new_addresses.csv')
+                with open(new_csv_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+                    writer = csv.writer(f)
+                    writer.writerow(('X', 'Y', 'Type'))
+                    for row in rows:
+                        writer.writerow(row)
+                        yield row
+            else:
+                yield from rows
+
+    def load(self, rows=None):
+        """Loads the geocoded rows into an arcpy feature class.
+        The rows are inserted into a memory feature class with one insert cursor, then copied to avoid_points in the
+        current workspace.
+
+        Args:
+            rows: Iterable of the (X, Y, Type) rows from transform, when None they are read from
+                ./data/new_addresses.csv which is only written by a previous run with persist_intermediate set.
 
         Returns:
-            arcpy XY table to point loads a feature class into an ArcGIS Pro db.
+            arcpy insert cursor loads a point feature class into an ArcGIS Pro db.
         """
-        arcpy.AddMessage('\nCreating a point feature class from input table\n')
+        arcpy.AddMessage('\nCreating a point feature class from geocoded addresses\n')
+
+        if rows is None:
+            in_table = set_path(self.config_dict['etl_dir'], 'new_addresses.csv')
+            self._check_intermediate(in_table)
+            with open(in_table, 'r', newline='', encoding='utf-8') as f:
+                csv_reader = csv.reader(f)
+                next(csv_reader)
+                rows = [(float(x), float(y), point_type) for x, y, point_type in csv_reader]
 
         # Setup local variables
-        in_table = set_path(self.config_dict['etl_dir'], 'new_addresses.csv')
+        # The geocoder returns longitude, latitude, the same WGS 1984 coordinate system XYTableToPoint defaults to.
         out_feature_class = 'avoid_points'
-        x_coords = 'X'
-        y_coords = 'Y'
+        spatial_reference = arcpy.SpatialReference(4326)
+
+        # rows is consumed while the addresses are still being geocoded, so the points are inserted into a memory
+        # feature class first. avoid_points is only replaced once every row is in, a geocoder failure part way
+        # through leaves the previous avoid_points in place instead of an empty one.
+        scratch_fc = arcpy.management.CreateFeatureclass('memory', out_feature_class, 'POINT',
+                                                         spatial_reference=spatial_reference)[0]
+        try:
+            # Create the point feature class with the same X, Y, and Type fields as the table
+            arcpy.management.AddFields(scratch_fc, [['X', 'DOUBLE'], ['Y', 'DOUBLE'], ['Type', 'TEXT']])
+            row_count = 0
+            with arcpy.da.InsertCursor(scratch_fc, ['SHAPE@XY', 'X', 'Y', 'Type']) as cursor:
+                for x, y, point_type in rows:
+                    cursor.insertRow(((x, y), x, y, point_type))
+                    row_count += 1
+            # One copy writes every point to the workspace, overwriteOutput replaces the previous avoid_points.
+            arcpy.management.CopyFeatures(scratch_fc, set_path(arcpy.env.workspace, out_feature_class))
+        finally:
+            arcpy.management.Delete(scratch_fc)
 
-        # Create XY event layer
-        arcpy.management.XYTableToPoint(in_table, out_feature_class, x_coords, y_coords)
+        arcpy.AddMessage(f'\nFeature class avoid_points created with {row_count} rows.')
 
-        arcpy.AddMessage(
-            f'\nFeature class avoid_points created with {arcpy.GetCount_management(out_feature_class)} rows.')
+    @staticmethod
+    def _check_intermediate(csv_path):
+        """Checks that an intermediate csv from a previous run exists before a stage reads it.
+
+        Args:
+            csv_path: Path of the intermediate csv.
+
+        Raises:
+            FileNotFoundError if the csv does not exist.
+        """
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f'{csv_path} does not exist, it is only written when persist_intermediate is set '
+                                    f'in the config yaml. Run the etl with process, or pass the previous stage output.')
 
     def process(self):
         """Runs the etl.
+        process is the supported entry point, transform is a generator that only runs as load consumes it.
 
         Returns:
             The extract, transform, and load processes are run.
         """
-        self.extract()
-        self.transform()
-        self.load()
+        # transform yields rows as they are geocoded and load inserts them as they arrive,
+        # so inserting into the feature class overlaps with the geocoder requests still in flight.
+        addresses = self.extract()
+        rows = self.transform(addresses)
+        self.load(rows)
@@ -7,16 +7,48 @@ Author: https://github.com/jamesjahraus
 ArcGIS Pro Python reference:
 https://pro.arcgis.com/en/pro-app/latest/arcpy/main/arcgis-pro-arcpy-reference.htm
 """
-import time
+import os
 import csv
+import filecmp
+import math
+import inspect
+import functools
 import arcpy
 import etl
 import logging
-import tkinter as tk
+import gp_utils
+from concurrent.futures import ThreadPoolExecutor
 from config import config_dict, set_path, setup_logging
 
+# pyogrio reads a whole field in one call, it is not part of the default ArcGIS Pro python environment so
+# generate_target_addresses_csv falls back to FeatureClassToNumPyArray when it is missing.
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
 logger = logging.getLogger(__name__)
 
+# Meters per linear unit accepted in the buffer distance input, parse_buf_distance rejects any other unit and
+# _run_analysis_gpd uses the factors to convert the distance for GeoPandas.
+_LINEAR_UNIT_METERS = {'feet': 0.3048, 'foot': 0.3048, 'yards': 0.9144, 'yard': 0.9144, 'miles': 1609.344,
+                       'mile': 1609.344, 'meters': 1.0, 'meter': 1.0, 'kilometers': 1000.0, 'kilometer': 1000.0}
+
+# Outline colour of every mapped feature, black.
+_OUTLINE = {'RGB': [0, 0, 0, 100]}
+
+# Opened ArcGIS Pro projects keyed by path, reused by render_layout and saved once by save_projects.
+_APRX_CACHE = {}
+
+# Geoprocessing results cached across runs, a tool is skipped when its inputs, parameters, and output are unchanged.
+# arcgis_setup turns the cache off when the output db is flushed, nothing could be reused.
+_GP_CACHE_DIR = set_path(config_dict['proj_dir'], 'gp_cache')
+_GP_CACHE_ENABLED = True
+# Large input db feature classes the analysis never rewrites, the cache keys them on count and extent instead of
+# hashing every row. avoid_points is rewritten by the etl every run so its rows are hashed.
+_GP_STATIC_INPUTS = frozenset(['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs',
+                               'OSMP_Properties', 'Boulder_Addresses'])
+
 
 def error_handler(func):
     """ Decorator to handle repetitive logging and try except code.
@@ -31,59 +63,54 @@ def error_handler(func):
         Anything the decorated function returns.
     """
 
+    # Looked up once per decorated function, logging only formats the messages if the level is enabled.
+    # unwrap reaches the function under other decorators such as lru_cache, which have no __code__.
+    name = func.__name__
+    lineno = inspect.unwrap(func).__code__.co_firstlineno
+
     def inner_func(*args, **kwargs):
         try:
-            logger.debug(f'Starting execution of {func.__name__} firstlineno: {func.__code__.co_firstlineno}.')
+            logger.debug('Starting execution of %s firstlineno: %d.', name, lineno)
             result = func(*args, **kwargs)
-            logger.debug(f'Completed execution of {func.__name__} firstlineno: {func.__code__.co_firstlineno}.')
+            logger.debug('Completed execution of %s firstlineno: %d.', name, lineno)
             return result
         except arcpy.ExecuteError:
-            arcpy.AddMessage(
-                f'arcpy.ExecuteError {func.__name__} firstlineno {func.__code__.co_firstlineno}\n{arcpy.GetMessages(2)}')
-            logger.error(
-                f'arcpy.ExecuteError {func.__name__} firstlineno {func.__code__.co_firstlineno}\n{arcpy.GetMessages(2)}')
+            messages = arcpy.GetMessages(2)
+            gp_utils.add_message(f'arcpy.ExecuteError {name} firstlineno {lineno}\n{messages}')
+            logger.error('arcpy.ExecuteError %s firstlineno %d\n%s', name, lineno, messages)
         except Exception as e:
-            arcpy.AddMessage(
-                f'Execution of {func.__name__} firstlineno: {func.__code__.co_firstlineno} failed due to error: {e}.')
-            logger.error(
-                f'Execution of {func.__name__} firstlineno: {func.__code__.co_firstlineno} failed due to error: {e}.')
+            gp_utils.add_message(f'Execution of {name} firstlineno: {lineno} failed due to error: {e}.')
+            logger.error('Execution of %s firstlineno: %d failed due to error: %s.', name, lineno, e)
 
     return inner_func
 
 
-@error_handler
-def check_status(result):
-    """Logs the status of executing geoprocessing tools.
+@functools.lru_cache(maxsize=32)
+def _spatial_reference(code):
+    """Cached arcpy.SpatialReference factory, avoids repeated projection engine lookups for the same code.
+
+    arcpy copies the spatial reference when it is assigned to the environment or a map, so sharing one is safe.
+
+    Args:
+        code: ESRI spatial reference code.
+
+    Returns:
+        The arcpy.SpatialReference for the code.
+    """
+    return arcpy.SpatialReference(code)
 
-    Requires futher investigation to refactor this function:
-        I can not find geoprocessing tool name in the result object.
-        If the tool name can not be found may need to pass it in.
-        Return result.getMessages() needs more thought on what it does.
 
-    Understanding message types and severity:
-    https://pro.arcgis.com/en/pro-app/arcpy/geoprocessing_and_python/message-types-and-severity.htm
+@error_handler
+def check_status(result):
+    """Logs the status of executing geoprocessing tools, see gp_utils.check_status.
 
     Args:
         result: An executing geoprocessing tool object.
 
     Returns:
-        Requires futher investigation on what result.getMessages() means on return.
+        The result messages.
     """
-    status_code = dict([(0, 'New'), (1, 'Submitted'), (2, 'Waiting'),
-                        (3, 'Executing'), (4, 'Succeeded'), (5, 'Failed'),
-                        (6, 'Timed Out'), (7, 'Canceling'), (8, 'Canceled'),
-                        (9, 'Deleting'), (10, 'Deleted')])
-
-    arcpy.AddMessage('current job status: {0}-{1}'.format(
-        result.status, status_code[result.status]))
-    # Wait until the tool completes
-    while result.status < 4:
-        arcpy.AddMessage('current job status (in while loop): {0}-{1}'.format(
-            result.status, status_code[result.status]))
-        time.sleep(0.2)
-    messages = result.getMessages()
-    arcpy.AddMessage('job messages: {0}'.format(messages))
-    return messages
+    return gp_utils.check_status(result, message=gp_utils.msg)
 
 
 @error_handler
@@ -97,17 +124,18 @@ def setup_env(workspace_path, spatial_reference):
     Returns:
         Side effect is ArcGIS Pro workspace is setup with desired db, spatial reference, and overwriteOutput = True.
     """
-    # Set workspace path.
+    # Set the workspace path, output overwrite option, and output spatial reference.
+    # The messages use the values that were set instead of reading each one back from arcpy.env.
+    output_sr = _spatial_reference(spatial_reference)
     arcpy.env.workspace = workspace_path
-    arcpy.AddMessage('workspace(s): {}'.format(arcpy.env.workspace))
-
-    # Set output overwrite option.
     arcpy.env.overwriteOutput = True
-    arcpy.AddMessage('overwriteOutput: {}'.format(arcpy.env.overwriteOutput))
-
-    # Set the output spatial reference.
-    arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(spatial_reference)
-    arcpy.AddMessage(f'outputCoordinateSystem: {arcpy.env.outputCoordinateSystem.name}')
+    # Repeated setups leave a matching output coordinate system alone.
+    current_sr = arcpy.env.outputCoordinateSystem
+    if current_sr is None or current_sr.factoryCode != output_sr.factoryCode:
+        arcpy.env.outputCoordinateSystem = output_sr
+    gp_utils.msg(f'workspace(s): {workspace_path}')
+    gp_utils.msg('overwriteOutput: True')
+    gp_utils.msg(f'outputCoordinateSystem: {output_sr.name}')
 
 
 @error_handler
@@ -125,16 +153,19 @@ def arcgis_setup(flush_output_db=False, spatial_reference=54016):
     Returns:
         Side effect is output db is setup, and ArcGIS Pro workspace orchestration is started with correct db.
     """
+    global _GP_CACHE_ENABLED
     output_db = config_dict.get('output_gdb_dir')
+    _GP_CACHE_ENABLED = not flush_output_db
     if flush_output_db:
-        arcpy.AddMessage('\nFlushing Output DB')
+        gp_utils.msg('\nFlushing Output DB')
         arcpy.env.workspace = output_db
-        arcpy.AddMessage(f'Contents of Output DB Before Flush {arcpy.ListFeatureClasses()}')
-        for fc in arcpy.ListFeatureClasses():
-            arcpy.AddMessage(f'Deleting: {fc}')
-            if arcpy.Exists(fc):
-                arcpy.Delete_management(fc)
-        arcpy.AddMessage(f'Contents of Output DB After Flush {arcpy.ListFeatureClasses()}\n')
+        # One catalog scan drives the delete, Delete takes a semicolon delimited list so every fc goes in one call.
+        fcs = arcpy.ListFeatureClasses() or []
+        if fcs:
+            arcpy.management.Delete(';'.join(fcs))
+        gp_utils.msg(f'Flushed {len(fcs)} FCs: {fcs}\n')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Contents of Output DB after flush %s', arcpy.ListFeatureClasses())
     # Setup Geoprocessing Environment
     input_db = config_dict.get('input_gdb_dir')
     setup_env(input_db, spatial_reference)
@@ -147,8 +178,8 @@ def run_etl():
     Returns:
         Side effect is avoid_points feature class is created in db.
     """
-    etl_instance = etl.GSheetsEtl(config_dict)
-    etl_instance.process()
+    with etl.GSheetsEtl(config_dict) as etl_instance:
+        etl_instance.process()
 
 
 @error_handler
@@ -164,31 +195,53 @@ def input_gui():
         user_inputs dictionary is returned:
             = {'intersect_fc': '', 'buf_distance': '', 'map_subtitle': ''}
     """
+    # Imported here so Tcl/Tk is only loaded when the gui is shown.
+    import tkinter as tk
+
     user_inputs = None
 
+    # Input key and label of each row, all widgets are created before the first geometry pass.
+    fields = [('intersect_fc', 'Intersect feature class name, example: IntersectAnalysis'),
+              ('buf_distance', 'Buffer distance, example: 2500 Feet'),
+              ('map_subtitle', 'Map subtitle, example: 2500 Feet')]
+    entries = {}
+
     def get_inputs():
         nonlocal user_inputs
-        user_inputs = {'intersect_fc': p1.get(), 'buf_distance': p2.get(), 'map_subtitle': p3.get()}
+        user_inputs = {key: entry.get() for key, entry in entries.items()}
 
     gui = tk.Tk()
     gui.wm_title('West Nile Virus Simulation Inputs')
-    tk.Label(gui, text='Intersect feature class name, example: IntersectAnalysis').grid(sticky=tk.W, row=0)
-    p1 = tk.Entry(gui)
-    p1.grid(row=0, column=1)
-    tk.Label(gui, text='Buffer distance, example: 2500 Feet').grid(sticky=tk.W, row=1)
-    p2 = tk.Entry(gui)
-    p2.grid(row=1, column=1)
-    tk.Label(gui, text='Map subtitle, example: 2500 Feet').grid(sticky=tk.W, row=2)
-    p3 = tk.Entry(gui)
-    p3.grid(row=2, column=1)
-    tk.Button(gui, text='Submit', command=get_inputs).grid(row=3, column=0, sticky=tk.W, pady=4)
+    for row, (key, text) in enumerate(fields):
+        tk.Label(gui, text=text).grid(sticky=tk.W, row=row)
+        entries[key] = tk.Entry(gui)
+        entries[key].grid(row=row, column=1)
+    tk.Button(gui, text='Submit', command=get_inputs).grid(row=len(fields), column=0, sticky=tk.W, pady=4)
     # Quit button hangs while program completes then gui crashes, workaround: close the window after inputs.
     # tk.Button(gui, text='Quit', command=gui.quit).grid(row=3, column=1, sticky=tk.W, pady=4)
-    gui.mainloop()
+    # Lay out once then block until the window is closed.
+    gui.update_idletasks()
+    gui.wait_window()
 
     return user_inputs
 
 
+def _gp_cache_key(tool, inputs, params):
+    """Geoprocessing result cache key, see gp_utils.cache_key.
+
+    Args:
+        tool: Name of the geoprocessing tool.
+        inputs: List of the input feature classes.
+        params: The other tool parameters.
+
+    Returns:
+        The cache key, None when the cache is turned off so the inputs are not fingerprinted.
+    """
+    if not _GP_CACHE_ENABLED:
+        return None
+    return gp_utils.cache_key(tool, inputs, params, static_inputs=_GP_STATIC_INPUTS)
+
+
 @error_handler
 def buffer(input_fc, output_fc, buf_distance):
     """Run ArcGIS Pro tool Buffer.
@@ -202,14 +255,54 @@ def buffer(input_fc, output_fc, buf_distance):
     Returns:
         Side effect is a buffer fc is output to a db.
     """
+    key = _gp_cache_key('Buffer', [input_fc], buf_distance)
+    if key and gp_utils.cache_hit(_GP_CACHE_DIR, key, output_fc):
+        gp_utils.msg(f'Buffer result cached: {output_fc}')
+        return
     result = arcpy.Buffer_analysis(input_fc, output_fc, buf_distance, "FULL", "ROUND", "ALL")
     check_status(result)
+    if key:
+        gp_utils.cache_store(_GP_CACHE_DIR, key, output_fc)
+
+
+@error_handler
+def add_spatial_index(fc):
+    """Run ArcGIS Pro tool Add Spatial Index.
+    https://pro.arcgis.com/en/pro-app/latest/tool-reference/data-management/add-spatial-index.htm
+
+    Overlay tools compare every pair of features when an input has no spatial index.
+
+    Args:
+        fc: Feature class to index, skipped if it already has a spatial index.
+
+    Returns:
+        Side effect is the feature class has a spatial index.
+    """
+    # AddSpatialIndex rebuilds an existing index, file gdb outputs are indexed when they are created and the input
+    # db is left alone once it is indexed.
+    if arcpy.Describe(fc).hasSpatialIndex:
+        return
+    result = arcpy.management.AddSpatialIndex(fc)
+    check_status(result)
+
+
+def _buffer_worker(task):
+    """Runs buffer in a worker thread.
+
+    Args:
+        task: Tuple of the buffer arguments (input_fc, output_fc, buf_distance).
+
+    Returns:
+        Side effect is an indexed buffer fc is output to a db.
+    """
+    buffer(*task)
+    add_spatial_index(task[1])
 
 
 @error_handler
 def intersect(fc_list, output_fc):
-    """Run ArcGIS Pro tool Intersect.
-    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/intersect.htm
+    """Run ArcGIS Pro tool Pairwise Intersect, multithreaded alternative to Intersect.
+    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/pairwise-intersect.htm
 
     Args:
         fc_list: List of feature classes to run Intersect Analysis on.
@@ -218,14 +311,20 @@ def intersect(fc_list, output_fc):
     Returns:
         Side effect is an intersect fc is output to a db.
     """
-    result = arcpy.Intersect_analysis(fc_list, output_fc, "ALL")
+    key = _gp_cache_key('PairwiseIntersect', fc_list, 'ALL')
+    if key and gp_utils.cache_hit(_GP_CACHE_DIR, key, output_fc):
+        gp_utils.msg(f'Intersect result cached: {output_fc}')
+        return
+    result = arcpy.analysis.PairwiseIntersect(fc_list, output_fc, "ALL")
     check_status(result)
+    if key:
+        gp_utils.cache_store(_GP_CACHE_DIR, key, output_fc)
 
 
 @error_handler
 def erase(input_fc, erase_fc, erase_output):
-    """Run ArcGIS Pro tool Erase.
-    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/erase.htm
+    """Run ArcGIS Pro tool Pairwise Erase, multithreaded alternative to Erase.
+    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/pairwise-erase.htm
 
     Erase the erase_fc from the input_fc
 
@@ -237,8 +336,14 @@ def erase(input_fc, erase_fc, erase_output):
     Returns:
         Side effect is an erase fc is output to a db.
     """
-    result = arcpy.Erase_analysis(input_fc, erase_fc, erase_output)
+    key = _gp_cache_key('PairwiseErase', [input_fc, erase_fc], '')
+    if key and gp_utils.cache_hit(_GP_CACHE_DIR, key, erase_output):
+        gp_utils.msg(f'Erase result cached: {erase_output}')
+        return
+    result = arcpy.analysis.PairwiseErase(input_fc, erase_fc, erase_output)
     check_status(result)
+    if key:
+        gp_utils.cache_store(_GP_CACHE_DIR, key, erase_output)
 
 
 @error_handler
@@ -256,30 +361,66 @@ def spatial_join(target_fc, join_fc, output_fc):
     Returns:
         Side effect is an spatial join fc is output to a db.
     """
+    key = _gp_cache_key('SpatialJoin', [target_fc, join_fc], 'KEEP_COMMON|WITHIN')
+    if key and gp_utils.cache_hit(_GP_CACHE_DIR, key, output_fc):
+        gp_utils.msg(f'Spatial Join result cached: {output_fc}')
+        return
     result = arcpy.SpatialJoin_analysis(target_fc, join_fc, output_fc, join_type="KEEP_COMMON",
                                         match_option="WITHIN")
     check_status(result)
+    if key:
+        gp_utils.cache_store(_GP_CACHE_DIR, key, output_fc)
 
 
 @error_handler
 def record_count(count_fc):
-    """Run ArcGIS Pro tool Get Count.
-    https://pro.arcgis.com/en/pro-app/latest/tool-reference/data-management/get-count.htm
+    """Counts the records in a feature class.
+
+    Iterates an OID only SearchCursor instead of dispatching the Get Count geoprocessing tool.
 
     Args:
-        count_fc: Feature class to run get count on.
+        count_fc: Feature class to count.
 
     Returns:
-        Returns the record count of features in a feature class.
+        Returns the record count of features in a feature class as an int.
     """
-    result = arcpy.GetCount_management(count_fc)
-    check_status(result)
-    return result[0]
+    with arcpy.da.SearchCursor(count_fc, ['OID@']) as cursor:
+        return sum(1 for _ in cursor)
+
+
+def _get_aprx(aprx_path):
+    """Opens an ArcGIS Pro project once per path.
+
+    Args:
+        aprx_path: path to the ArcGIS Pro project.
+
+    Returns:
+        The cached arcpy.mp.ArcGISProject object.
+    """
+    aprx = _APRX_CACHE.get(aprx_path)
+    if aprx is None:
+        aprx = arcpy.mp.ArcGISProject(aprx_path)
+        _APRX_CACHE[aprx_path] = aprx
+    return aprx
+
+
+@error_handler
+def save_projects():
+    """Saves every cached ArcGIS Pro project once all map and layout changes are made.
+
+    Returns:
+        Side effect is the projects opened with _get_aprx are saved.
+    """
+    for aprx in _APRX_CACHE.values():
+        aprx.save()
+        gp_utils.add_message(f'aprx saved: {aprx.filePath}')
 
 
 @error_handler
+@functools.lru_cache(maxsize=4)
 def get_map(aprx, map_name):
     """Finds an existing map in an ArcGIS Pro project.
+    Cached by project and map name, a map that is not found raises so it is not cached.
 
     Args:
         aprx: path to the ArcGIS Pro project.
@@ -291,10 +432,11 @@ def get_map(aprx, map_name):
     Raises:
         ValueError if a map doesn't exist in the db.
     """
-    for mp in aprx.listMaps():
-        if map_name == mp.name:
-            arcpy.AddMessage(f'Map called {mp.name} found')
-            return mp
+    # listMaps filters by name instead of iterating every map in the project.
+    mps = aprx.listMaps(map_name)
+    if mps:
+        gp_utils.add_message(f'Map called {mps[0].name} found')
+        return mps[0]
     raise ValueError(f'Map called {map_name} does not exist in current aprx {aprx.filePath}')
 
 
@@ -310,38 +452,53 @@ def set_spatial_reference(mp, spatial_reference):
         Side effect is the spatial reference of a map object is set with an ESRI code.
     """
     # Set spatial reference
-    mp.spatialReference = arcpy.SpatialReference(spatial_reference)
+    mp.spatialReference = _spatial_reference(spatial_reference)
 
 
 @error_handler
-def add_feature_to_map(aprx_mp, lyr_name, output_fc, colour, transparency):
+def add_feature_to_map(aprx_mp, layers_by_name, lyr_name, output_fc, colour, transparency):
     """Adds a feature class to a map object.
 
     Args:
         aprx_mp: arcpy map object
+        layers_by_name: dict of the map's layers by name, built once in render_layout and kept up to date.
         lyr_name: name of an arcpy layer
         output_fc: feature class that will be transformed into a layer.
-        colour: four element list with an RGB colour code, the last element represents the opacity value.
+        colour: {'RGB': four element list} colour dict, the last element of the RGB code represents the opacity value.
         transparency: the desired % transparency
 
     Returns:
         Side effect is a feature class will be rendered on a map object.
     """
-    arcpy.AddMessage('\nAdding feature to map.')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            arcpy.AddMessage(f'layer {0} already exists, deleting {lyr_name} ...')
-            aprx_mp.removeLayer(lyr)
-            break
-    lyr = arcpy.MakeFeatureLayer_management(output_fc, lyr_name)
-    aprx_mp.addLayer(lyr[0], 'TOP')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            sym = lyr.symbology
-            sym.renderer.symbol.color = {'RGB': colour}
-            sym.renderer.symbol.outlineColor = {'RGB': [0, 0, 0, 100]}
-            lyr.symbology = sym
-            lyr.transparency = transparency
+    gp_utils.msg('\nAdding feature to map.')
+    existing = layers_by_name.pop(lyr_name, None)
+    if existing:
+        gp_utils.msg(f'layer {lyr_name} already exists, deleting {lyr_name} ...')
+        aprx_mp.removeLayer(existing)
+    # Symbology is cached as one layer file per geometry type, fill, and outline colour, applying a template is one
+    # tool call instead of a CIM round trip through the layer's symbology property.
+    template_dir = set_path(config_dict['proj_dir'], 'symbology')
+    shape_type = arcpy.Describe(output_fc).shapeType
+    fill = '_'.join(str(c) for c in colour['RGB'])
+    outline = '_'.join(str(c) for c in _OUTLINE['RGB'])
+    template = set_path(template_dir, f'{shape_type}_{fill}_outline_{outline}.lyrx')
+    have_template = os.path.exists(template)
+    lyr = arcpy.MakeFeatureLayer_management(output_fc, lyr_name)[0]
+    if have_template:
+        # In a script the applied symbology is on the tool's output layer, not the input layer object.
+        lyr = arcpy.management.ApplySymbologyFromLayer(lyr, template, update_symbology='MAINTAIN')[0]
+    aprx_mp.addLayer(lyr, 'TOP')
+    new_lyr = aprx_mp.listLayers(lyr_name)[0]
+    layers_by_name[lyr_name] = new_lyr
+    if not have_template:
+        sym = new_lyr.symbology
+        sym.renderer.symbol.color = colour
+        sym.renderer.symbol.outlineColor = _OUTLINE
+        new_lyr.symbology = sym
+        os.makedirs(template_dir, exist_ok=True)
+        arcpy.management.SaveToLayerFile(new_lyr, template)
+        gp_utils.msg(f'Symbology template saved: {template}')
+    new_lyr.transparency = transparency
 
 
 @error_handler
@@ -357,14 +514,13 @@ def export_map(aprx, subtitle, address_count):
         Side effect is a layout is exported to a pdf file for the map output.
     """
     lyt = aprx.listLayouts()[0]
-    for el in lyt.listElements():
-        arcpy.AddMessage(el.name)
-        if 'Title' in el.name:
-            el.text = f'{el.text} {subtitle}'
-            arcpy.AddMessage(el.text)
-        elif 'AddressCount' in el.name:
-            el.text = f'{el.text} {address_count}'
-            arcpy.AddMessage(el.text)
+    # listElements filters by type and name, only the text elements that are updated are returned.
+    for el in lyt.listElements('TEXT_ELEMENT', '*Title*'):
+        el.text = f'{el.text} {subtitle}'
+        gp_utils.msg(el.text)
+    for el in lyt.listElements('TEXT_ELEMENT', '*AddressCount*'):
+        el.text = f'{el.text} {address_count}'
+        gp_utils.msg(el.text)
     lyt.exportToPDF(f'{config_dict["proj_dir"]}/wnv.pdf')
 
 
@@ -385,15 +541,17 @@ def render_layout(map_subtitle, map_features, map_spatial_reference, address_cou
         Side effect is rendering functions are provided with correct inputs for layout configuration and pdf file output.
     """
     aprx_path = set_path(config_dict.get('proj_dir'), 'WestNileOutbreak.aprx')
-    aprx = arcpy.mp.ArcGISProject(aprx_path)
-    arcpy.AddMessage(f'aprx path: {aprx.filePath}')
+    aprx = _get_aprx(aprx_path)
+    gp_utils.add_message(f'aprx path: {aprx.filePath}')
     mp = get_map(aprx, 'Map')
     set_spatial_reference(mp, map_spatial_reference)
+    # Layers by name, scanned once instead of once per feature.
+    layers_by_name = {lyr.name: lyr for lyr in mp.listLayers()}
     for f, c in map_features:
         fc_name = f
         fc = set_path(output_db, f)
         colour = c
-        add_feature_to_map(mp, fc_name, fc, colour, transparency=50)
+        add_feature_to_map(mp, layers_by_name, fc_name, fc, colour, transparency=50)
 
     # Export final map
     export_map(aprx, map_subtitle, address_count)
@@ -411,78 +569,208 @@ def generate_target_addresses_csv(fc):
     Returns:
         Side effect is target_addresses.csv is created in the WestNileOutbreak project directory.
     """
-    # Reference: https://pro.arcgis.com/en/pro-app/latest/arcpy/data-access/searchcursor-class.htm
     csv_path = f'{config_dict["proj_dir"]}/target_addresses.csv'
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['TargetAddresses']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        fields = ['FULLADDR']
-        with arcpy.da.SearchCursor(fc, fields) as cursor:
-            for row in cursor:
-                # arcpy.AddMessage(f'Address = {row[0]}')
-                row_dict = {'TargetAddresses': row[0]}
-                # arcpy.AddMessage(f'Writing row to new_addresses.csv: {row_dict}')
-                writer.writerow(row_dict)
+    # The csv is written to a temporary file and swapped in, a failed run never leaves a partial csv behind.
+    tmp_path = f'{csv_path}.{os.getpid()}.tmp'
+    try:
+        if pyogrio is not None:
+            # Bulk read the address field into a DataFrame and write the csv in one pass.
+            gdb, layer = os.path.split(fc)
+            df = pyogrio.read_dataframe(gdb, layer=layer, columns=['FULLADDR'], read_geometry=False)
+            df.rename(columns={'FULLADDR': 'TargetAddresses'}).to_csv(tmp_path, index=False, encoding='utf-8')
+        else:
+            # Reference: https://pro.arcgis.com/en/pro-app/latest/arcpy/data-access/featureclasstonumpyarray.htm
+            # Read the address field in one call, null addresses are written as empty strings.
+            addresses = arcpy.da.FeatureClassToNumPyArray(fc, ['FULLADDR'], null_value='')['FULLADDR'].tolist()
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['TargetAddresses'])
+                writer.writerows([(address,) for address in addresses])
+        # An unchanged csv is left in place so its modified time only changes when the addresses do.
+        if os.path.exists(csv_path) and filecmp.cmp(tmp_path, csv_path, shallow=False):
+            gp_utils.msg(f'Target addresses unchanged: {csv_path}')
+        else:
+            os.replace(tmp_path, csv_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _intersect_via_rtree(geoms_a, geoms_b):
+    """Intersects two arrays of polygons, only the pairs whose envelopes overlap are intersected.
+
+    An STRtree on geoms_a finds the candidate pairs, where one polygon properly contains the other the inner polygon
+    is the intersection and the overlay kernel is skipped.
+
+    Args:
+        geoms_a: numpy array of shapely polygons.
+        geoms_b: numpy array of shapely polygons.
+
+    Returns:
+        numpy array of the polygons of the intersection.
+    """
+    import numpy
+    import shapely
+
+    tree = shapely.STRtree(geoms_a)
+    idx_b, idx_a = tree.query(geoms_b, predicate='intersects')
+    a, b = geoms_a[idx_a], geoms_b[idx_b]
+    shapely.prepare(a)
+    shapely.prepare(b)
+    a_contains = shapely.contains_properly(a, b)
+    b_contains = shapely.contains_properly(b, a) & ~a_contains
+    rest = ~(a_contains | b_contains)
+    result = numpy.empty(len(a), dtype=object)
+    result[a_contains] = b[a_contains]
+    result[b_contains] = a[b_contains]
+    result[rest] = shapely.intersection(a[rest], b[rest])
+
+    # Drop the lines and points where polygons only touch, same as keep_geom_type.
+    parts = shapely.get_parts(result)
+    return parts[shapely.get_type_id(parts) == 3]
+
+
+def parse_buf_distance(buf_distance):
+    """Parses and validates the buffer distance input.
+
+    Args:
+        buf_distance: Buffer distance from the input gui, example: 2500 Feet.
+
+    Returns:
+        Tuple of the distance as a float and the linear unit.
+
+    Raises:
+        ValueError if buf_distance is not a positive finite number followed by a supported linear unit.
+    """
+    parts = buf_distance.split()
+    try:
+        value, unit = float(parts[0]), parts[1]
+    except (IndexError, ValueError):
+        value, unit = 0.0, ''
+    if len(parts) != 2 or not math.isfinite(value) or value <= 0:
+        raise ValueError(f'Buffer distance {buf_distance!r} is not a positive number and unit, example: 2500 Feet')
+    if unit.lower() not in _LINEAR_UNIT_METERS:
+        raise ValueError(f'Buffer distance unit {unit!r} is not one of {", ".join(sorted(_LINEAR_UNIT_METERS))}')
+    return value, unit
 
 
 @error_handler
-def run_analysis(output_db):
+def _run_analysis_gpd(output_db, buf_value, buf_unit):
+    """GeoPandas analysis pipeline.
+
+    Runs the buffer, intersect, and erase analysis as one pass over shapely geometries instead of with arcpy
+    geoprocessing tools, the input feature classes are read once and only the outputs needed downstream are written.
+    Used by run_analysis when use_gpd_pipeline is set in the config yaml, requires geopandas and pyogrio.
+
+    Args:
+        output_db: path of the output data base the output feature classes are written to.
+        buf_value: Buffer distance value, see parse_buf_distance.
+        buf_unit: Buffer distance linear unit, see parse_buf_distance.
+
+    Returns:
+        Side effect is final_analysis and avoid_points_buf exist in output_db
+    """
+    import geopandas
+    import shapely
+
+    if pyogrio is None:
+        raise ImportError('use_gpd_pipeline requires pyogrio')
+    input_db = config_dict.get('input_gdb_dir')
+    risk_fc_list = ['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs', 'OSMP_Properties']
+
+    # Read every input once and project to the output coordinate system used by the arcpy tools.
+    gdfs = {fc: pyogrio.read_dataframe(input_db, layer=fc) for fc in risk_fc_list + ['avoid_points']}
+    output_sr = arcpy.env.outputCoordinateSystem
+    crs = f'ESRI:{output_sr.factoryCode}' if output_sr else gdfs[risk_fc_list[0]].crs
+    gdfs = {fc: gdf.to_crs(crs) for fc, gdf in gdfs.items()}
+
+    # Convert the buffer distance, example: 2500 Feet, to the units of the coordinate system.
+    crs_unit_meters = gdfs[risk_fc_list[0]].crs.axis_info[0].unit_conversion_factor
+    distance = buf_value * _LINEAR_UNIT_METERS[buf_unit.lower()] / crs_unit_meters
+
+    # Buffer, intersect, and erase are fused on shapely geometries, nothing is written between the steps.
+    # Buffer and dissolve each layer, same as Buffer_analysis with dissolve ALL.
+    bufs = {fc: shapely.union_all(shapely.buffer(gdf.geometry.to_numpy(), distance)) for fc, gdf in gdfs.items()}
+
+    # Intersect the polygons of the high risk buffers, see _intersect_via_rtree, then erase the avoid points buffer.
+    inter = shapely.get_parts(bufs[risk_fc_list[0]])
+    for fc in risk_fc_list[1:]:
+        inter = _intersect_via_rtree(inter, shapely.get_parts(bufs[fc]))
+    final = shapely.difference(shapely.union_all(inter), bufs['avoid_points'])
+
+    # Write only the feature classes used by the spatial join and the map.
+    for name, geom in [('avoid_points_buf', bufs['avoid_points']), ('final_analysis', final)]:
+        gdf = geopandas.GeoDataFrame(geometry=[geom], crs=crs)
+        pyogrio.write_dataframe(gdf, output_db, layer=name, driver='OpenFileGDB', layer_options={'OVERWRITE': 'YES'})
+        gp_utils.add_message(f'{name} written to {output_db}')
+
+
+@error_handler
+def run_analysis(output_db, user_inputs):
     """Analysis orchestration.
 
     Coordinates geospatial analysis operations to create required output feature classes:
      - final_analysis
      - avoid_points_buf
      - Target_Addresses
+    When use_gpd_pipeline is set in the config yaml the buffer, intersect, and erase steps run in _run_analysis_gpd
+    and the intermediate buffer and intersect feature classes are not written.
 
     Args:
         output_db: path of the output data base so each geoprocessing tool can write ouput feature classes.
+        user_inputs: Simulation parameters dictionary returned by input_gui.
 
     Returns:
         Results dictionary with the addresses at risk and map subtitle.
         Side effect is final_analysis, avoid_points_buf, Target_Addresses exist in output_db
     """
-    # Start Input GUI
-    user_inputs = input_gui()
     logger.info(f'Simulation Parameters: {user_inputs}')
 
-    # Buffer Analysis
-    # Create buffers around high risk areas that will require pesticide control spraying.
-    # Avoid points is also buffered here for convenience.
-    # Avoid points will not be included in the intersect analysis.
-    # Avoid points buffer represents individuals that signed up to opt out of pesticide control spraying.
-    buf_fc_list = ['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs', 'OSMP_Properties',
-                   'avoid_points']
-    for fc in buf_fc_list:
-        buf_distance = user_inputs['buf_distance']
-        buf_fc_name = f'{fc}_buf'
-        buf_fc = set_path(output_db, buf_fc_name)
-        buffer(fc, buf_fc, buf_distance)
-
-    # Intersect Analysis
-    # Create an intersect feature layer of all the high risk buffer areas.
-    # The intersect feature layer represents the highest risk zone for West Nile Virus transmission.
-    # The intersect feature layer includes all areas that will require pesticide control spraying.
-    intersect_fc_list = []
-    for fn in buf_fc_list:
-        if fn == 'avoid_points':
-            arcpy.AddMessage('\nSkipping avoid_points not used for Intersect Analysis.\n')
-        else:
-            intersect_fn = set_path(output_db, f'{fn}_buf')
-            intersect_fc_list.append(intersect_fn)
-    intersect_fc_name = user_inputs['intersect_fc']
-    intersect_fc = set_path(output_db, intersect_fc_name)
-    intersect(intersect_fc_list, intersect_fc)
-
-    # Erase the intersection of the intersect layer and the avoid points.
-    # Pesticide control spraying needs to occur in the intersect layer.
-    # However the city can not spray in the avoid points buffer.
-    # Therefore the avoid points will be erased from the intersect layer.
-    # The resulting layer will be safe for pesticide control spraying.
-    erase_input = intersect_fc
-    erase_fc = set_path(output_db, 'avoid_points_buf')
-    erase_output = set_path(output_db, 'final_analysis')
-    erase(erase_input, erase_fc, erase_output)
+    # Parse the buffer distance once, malformed input fails here instead of part way through the buffers.
+    buf_value, buf_unit = parse_buf_distance(user_inputs['buf_distance'])
+
+    if config_dict.get('use_gpd_pipeline', False):
+        # Buffer, intersect, and erase in memory, see _run_analysis_gpd.
+        _run_analysis_gpd(output_db, buf_value, buf_unit)
+    else:
+        # Buffer Analysis
+        # Create buffers around high risk areas that will require pesticide control spraying.
+        # Avoid points is also buffered here for convenience.
+        # Avoid points will not be included in the intersect analysis.
+        # Avoid points buffer represents individuals that signed up to opt out of pesticide control spraying.
+        # The buffers are independent, arcpy releases the GIL while a tool runs so they run in parallel threads.
+        buf_fc_list = ['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs', 'OSMP_Properties',
+                       'avoid_points']
+        buf_distance = f'{buf_value} {buf_unit}'
+        # Output path of each buffer, joined once and reused by the intersect and erase.
+        buf_paths = {fc: set_path(output_db, f'{fc}_buf') for fc in buf_fc_list}
+        tasks = [(fc, buf_paths[fc], buf_distance) for fc in buf_fc_list]
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            list(executor.map(_buffer_worker, tasks))
+
+        # Intersect Analysis
+        # Create an intersect feature layer of all the high risk buffer areas.
+        # The intersect feature layer represents the highest risk zone for West Nile Virus transmission.
+        # The intersect feature layer includes all areas that will require pesticide control spraying.
+        intersect_fc_list = []
+        for fn in buf_fc_list:
+            if fn == 'avoid_points':
+                gp_utils.msg('\nSkipping avoid_points not used for Intersect Analysis.\n')
+            else:
+                intersect_fc_list.append(buf_paths[fn])
+        intersect_fc_name = user_inputs['intersect_fc']
+        intersect_fc = set_path(output_db, intersect_fc_name)
+        intersect(intersect_fc_list, intersect_fc)
+
+        # Erase the intersection of the intersect layer and the avoid points.
+        # Pesticide control spraying needs to occur in the intersect layer.
+        # However the city can not spray in the avoid points buffer.
+        # Therefore the avoid points will be erased from the intersect layer.
+        # The resulting layer will be safe for pesticide control spraying.
+        erase_input = intersect_fc
+        erase_fc = buf_paths['avoid_points']
+        erase_output = set_path(output_db, 'final_analysis')
+        erase(erase_input, erase_fc, erase_output)
 
     # Perform a spatial join between Boulder_addresses and final_analysis.
     # Then count the addresses in the Target_addresses layer.
@@ -492,9 +780,11 @@ def run_analysis(output_db):
     target_fc = 'Boulder_Addresses'
     join_fc = set_path(output_db, 'final_analysis')
     join_output_fc = set_path(output_db, 'Target_Addresses')
+    add_spatial_index(target_fc)
+    add_spatial_index(join_fc)
     spatial_join(target_fc, join_fc, join_output_fc)
     addresses_at_risk_count = record_count(join_output_fc)
-    arcpy.AddMessage(f'\nBoulder Addresses at-risk =  {addresses_at_risk_count}\n')
+    gp_utils.add_message(f'\nBoulder Addresses at-risk =  {addresses_at_risk_count}\n')
 
     # Create a dictionary of results for external use
     results = {'addresses_at_risk_count': addresses_at_risk_count,
@@ -520,15 +810,20 @@ def main(flush_output_db=False):
     arcgis_setup(flush_output_db, spatial_reference=pcs)
     # Setup output db
     output_db = config_dict.get('output_gdb_dir')
-    arcpy.AddMessage(f'output db: {output_db}')
+    gp_utils.add_message(f'output db: {output_db}')
 
     # ----- run_etl -----
     # Run etl, generates the avoid_points feature class.
-    run_etl()
+    # The etl runs in a background thread while the input gui waits for the user, tkinter stays on the main thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        etl_future = executor.submit(run_etl)
+        # Start Input GUI
+        user_inputs = input_gui()
+        etl_future.result()
 
     # ----- run_analysis -----
     # Run Analysis to create the final analysis features.
-    analysis_results_dictionary = run_analysis(output_db)
+    analysis_results_dictionary = run_analysis(output_db, user_inputs)
 
     # ----- render_layout -----
     # Render the map including analysis features, correct colours, subtitle, and addresses at risk count.
@@ -536,9 +831,9 @@ def main(flush_output_db=False):
     # analysis_results_dictionary below is included for debugging so don't have to run_analysis:
     # analysis_results_dictionary = {'map_subtitle': 'debug subtitle', 'addresses_at_risk_count': 123}
 
-    map_features = [('final_analysis', [255, 0, 0, 100]),
-                    ('avoid_points_buf', [115, 178, 255, 100]),
-                    ('Target_Addresses', [102, 119, 205, 100])]
+    map_features = [('final_analysis', {'RGB': [255, 0, 0, 100]}),
+                    ('avoid_points_buf', {'RGB': [115, 178, 255, 100]}),
+                    ('Target_Addresses', {'RGB': [102, 119, 205, 100]})]
     map_subtitle = analysis_results_dictionary['map_subtitle']
     map_spatial_reference = pcs
     address_count = analysis_results_dictionary['addresses_at_risk_count']
@@ -549,6 +844,10 @@ def main(flush_output_db=False):
     target_addresses_fc = set_path(output_db, 'Target_Addresses')
     generate_target_addresses_csv(target_addresses_fc)
 
+    # Save the project once, after the map and layout are complete.
+    save_projects()
+    gp_utils.flush_messages()
+
 
 if __name__ == '__main__':
     # Setup the logger to generate log file use commands: logger.debug(msg), logger.info(msg)
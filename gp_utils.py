@@ -0,0 +1,201 @@
+""" Geoprocessing utilities shared by finalproject, lab2, and lab3.
+
+ArcGIS Pro Python reference:
+https://pro.arcgis.com/en/pro-app/latest/arcpy/main/arcgis-pro-arcpy-reference.htm
+"""
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+import arcpy
+from config import config_dict
+
+# Geoprocessing result status names by result.status.
+_STATUS_CODE = {0: 'New', 1: 'Submitted', 2: 'Waiting', 3: 'Executing', 4: 'Succeeded', 5: 'Failed', 6: 'Timed Out',
+                7: 'Canceling', 8: 'Canceled', 9: 'Deleting', 10: 'Deleted'}
+
+# Progress messages are buffered by msg and sent to arcpy.AddMessage together instead of one call per message.
+# Set verbose_messages to False in the config yaml to drop them.
+VERBOSE = config_dict.get('verbose_messages', True)
+_MESSAGES = []
+# Worker threads share the message buffer, the lock keeps messages from interleaving or being lost.
+_MESSAGES_LOCK = threading.RLock()
+
+
+def flush_messages():
+    r"""Sends the buffered progress messages to arcpy.AddMessage as one message.
+
+    Returns:
+        N/A
+    """
+    with _MESSAGES_LOCK:
+        if _MESSAGES:
+            arcpy.AddMessage('\n'.join(_MESSAGES))
+            _MESSAGES.clear()
+
+
+def msg(message):
+    r"""Buffers a progress message, the buffer is flushed every 32 messages and at exit.
+
+    Arguments:
+        message: The message to send to arcpy.AddMessage, dropped unless VERBOSE is set.
+    Returns:
+        N/A
+    """
+    if VERBOSE:
+        with _MESSAGES_LOCK:
+            _MESSAGES.append(message)
+            if len(_MESSAGES) >= 32:
+                flush_messages()
+
+
+def add_message(message):
+    r"""Sends a message to arcpy.AddMessage right away, after the buffered progress messages.
+
+    Flushing first keeps the output in the order the messages were created.
+
+    Arguments:
+        message: The message to send to arcpy.AddMessage, always shown.
+    Returns:
+        N/A
+    """
+    with _MESSAGES_LOCK:
+        flush_messages()
+        arcpy.AddMessage(message)
+
+
+atexit.register(flush_messages)
+
+
+def check_status(result, message=arcpy.AddMessage, poll_interval=0.005, max_interval=0.5):
+    r"""Logs the status of executing geoprocessing tools.
+
+    Requires futher investigation to refactor this function:
+        I can not find geoprocessing tool name in the result object.
+        If the tool name can not be found may need to pass it in.
+        Return result.getMessages() needs more thought on what it does.
+
+    Understanding message types and severity:
+    https://pro.arcgis.com/en/pro-app/arcpy/geoprocessing_and_python/message-types-and-severity.htm
+
+    Arguments:
+        result: An executing geoprocessing tool object.
+        message: Function the status messages are sent to, default arcpy.AddMessage.
+        poll_interval: First wait in seconds while the tool is executing, doubled after every poll.
+        max_interval: Longest wait in seconds between polls.
+    Returns:
+        Requires futher investigation on what result.getMessages() means on return.
+    """
+    message('current job status: {0}-{1}'.format(
+        result.status, _STATUS_CODE[result.status]))
+    # Wait until the tool completes, backing off exponentially so short tools return quickly.
+    # Results are usually already complete when returned so the loop is normally skipped.
+    delay = poll_interval
+    polls = 0
+    while result.status < 4:
+        time.sleep(delay)
+        delay = min(delay * 2, max_interval)
+        polls += 1
+    if polls:
+        message('current job status after {0} polls: {1}-{2}'.format(
+            polls, result.status, _STATUS_CODE[result.status]))
+    messages = result.getMessages()
+    message('job messages: {0}'.format(messages))
+    return messages
+
+
+def summary(fc):
+    r"""Summarizes a feature class by its record count and extent.
+
+    Two Describe/GetCount calls instead of reading every row, used for large inputs that are not rewritten by the
+    analysis and for checking that a cached output is still the one that was stored.
+
+    Arguments:
+        fc: Feature class to summarize.
+    Returns:
+        String that changes when features are added or removed, or the extent changes.
+    """
+    extent = arcpy.Describe(fc).extent
+    count = arcpy.management.GetCount(fc)[0]
+    return f'{count}:{extent.XMin},{extent.YMin},{extent.XMax},{extent.YMax}'
+
+
+def fingerprint(fc):
+    r"""Fingerprints the contents of a feature class by hashing every row.
+
+    The count and extent are not enough for inputs that change between runs, a dissolved buffer is always one
+    feature and its extent does not change when a point inside it is added or moved. Every row is read so it is
+    only used for small inputs, see cache_key.
+
+    Arguments:
+        fc: Feature class to fingerprint.
+    Returns:
+        sha256 hex digest of the object id, geometry, and attributes of every feature.
+    """
+    fields = ['OID@', 'SHAPE@WKB'] + [f.name for f in arcpy.ListFields(fc)
+                                      if f.type not in ('OID', 'Geometry', 'Blob', 'Raster')]
+    digest = hashlib.sha256()
+    with arcpy.da.SearchCursor(fc, fields) as cursor:
+        for row in cursor:
+            digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_key(tool, inputs, params, static_inputs=()):
+    r"""Geoprocessing result cache key.
+
+    Arguments:
+        tool: Name of the geoprocessing tool.
+        inputs: List of the input feature classes, their contents are fingerprinted.
+        params: The other tool parameters, the output coordinate system is included automatically.
+        static_inputs: Names of large inputs that are not rewritten between runs, they are keyed on their summary
+            instead of reading every row.
+    Returns:
+        sha256 hex digest of the tool, input fingerprints, and parameters.
+    """
+    output_sr = arcpy.env.outputCoordinateSystem
+    sr_code = output_sr.factoryCode if output_sr else None
+    fingerprints = '|'.join(f'{fc}:{summary(fc) if fc in static_inputs else fingerprint(fc)}' for fc in inputs)
+    return hashlib.sha256(f'{tool}|{fingerprints}|{params}|{sr_code}'.encode('utf-8')).hexdigest()
+
+
+def cache_hit(cache_dir, key, output_fc):
+    r"""Checks if a geoprocessing result is cached and its output is unchanged.
+
+    Arguments:
+        cache_dir: Directory of the cache entries, one file per key.
+        key: Cache key, see cache_key.
+        output_fc: The tool's output feature class.
+    Returns:
+        True if output_fc still holds the result stored for key, the output is compared by its summary.
+    """
+    try:
+        with open(os.path.join(cache_dir, key), encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (entry.get('output_fc') == output_fc and arcpy.Exists(output_fc)
+            and entry.get('summary') == summary(output_fc))
+
+
+def cache_store(cache_dir, key, output_fc):
+    r"""Stores a geoprocessing result in the cache.
+
+    Each key is its own file, it is written to a temporary file named by process and thread then renamed so
+    a reader never sees a partly written entry.
+
+    Arguments:
+        cache_dir: Directory of the cache entries, one file per key.
+        key: Cache key, see cache_key.
+        output_fc: The tool's output feature class.
+    Returns:
+        N/A
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'output_fc': output_fc, 'summary': summary(output_fc)}, f)
+    os.replace(tmp_path, path)
@@ -1,12 +1,17 @@
-import time
+import atexit
+import functools
 import arcpy
 import etl
 from config import config_dict, set_path
+from gp_utils import check_status
 
 
+@functools.lru_cache(maxsize=None)
 def import_spatial_reference(dataset):
     r"""Extracts the spatial reference from input dataset.
 
+    Cached by dataset path, Describe is only run once per dataset.
+
     Arguments:
         dataset: Dataset with desired spatial reference.
     Returns:
@@ -26,46 +31,17 @@ def setup_env(workspace_path, spatial_ref_dataset):
     arcpy.env.overwriteOutput = True
     arcpy.AddMessage('overwriteOutput: {}'.format(arcpy.env.overwriteOutput))
 
-    # Set the output spatial reference.
-    arcpy.env.outputCoordinateSystem = import_spatial_reference(
-        spatial_ref_dataset)
+    # Set the output spatial reference, skipped when the environment already matches.
+    # A custom spatial reference has factoryCode 0 so it is always set.
+    spatial_reference = import_spatial_reference(spatial_ref_dataset)
+    current_sr = arcpy.env.outputCoordinateSystem
+    if (current_sr is None or not spatial_reference.factoryCode
+            or current_sr.factoryCode != spatial_reference.factoryCode):
+        arcpy.env.outputCoordinateSystem = spatial_reference
     arcpy.AddMessage('outputCoordinateSystem: {}'.format(
         arcpy.env.outputCoordinateSystem.name))
 
 
-def check_status(result):
-    r"""Logs the status of executing geoprocessing tools.
-
-    Requires futher investigation to refactor this function:
-        I can not find geoprocessing tool name in the result object.
-        If the tool name can not be found may need to pass it in.
-        Return result.getMessages() needs more thought on what it does.
-
-    Understanding message types and severity:
-    https://pro.arcgis.com/en/pro-app/arcpy/geoprocessing_and_python/message-types-and-severity.htm
-
-    Arguments:
-        result: An executing geoprocessing tool object.
-    Returns:
-        Requires futher investigation on what result.getMessages() means on return.
-    """
-    status_code = dict([(0, 'New'), (1, 'Submitted'), (2, 'Waiting'),
-                        (3, 'Executing'), (4, 'Succeeded'), (5, 'Failed'),
-                        (6, 'Timed Out'), (7, 'Canceling'), (8, 'Canceled'),
-                        (9, 'Deleting'), (10, 'Deleted')])
-
-    arcpy.AddMessage('current job status: {0}-{1}'.format(
-        result.status, status_code[result.status]))
-    # Wait until the tool completes
-    while result.status < 4:
-        arcpy.AddMessage('current job status (in while loop): {0}-{1}'.format(
-            result.status, status_code[result.status]))
-        time.sleep(0.2)
-    messages = result.getMessages()
-    arcpy.AddMessage('job messages: {0}'.format(messages))
-    return messages
-
-
 def arcgis_setup():
     # Setup Geoprocessing Environment
     spatial_ref_dataset = config_dict.get('spatial_ref_dataset')
@@ -75,15 +51,16 @@ def arcgis_setup():
 
 def run_etl():
     arcpy.AddMessage('Etl process starting...')
-    etl_instance = etl.GSheetsEtl(config_dict)
-    etl_instance.process()
+    with etl.GSheetsEtl(config_dict) as etl_instance:
+        etl_instance.process()
 
 
 def get_map(aprx, map_name):
-    for mp in aprx.listMaps():
-        if map_name == mp.name:
-            arcpy.AddMessage(f'Map called {mp.name} found')
-            return mp
+    # listMaps filters by name instead of iterating every map in the project.
+    maps = aprx.listMaps(map_name)
+    if maps:
+        arcpy.AddMessage(f'Map called {maps[0].name} found')
+        return maps[0]
     raise ValueError(f'Map called {map_name} does not exist in current aprx {aprx.filePath}')
 
 
@@ -150,13 +127,14 @@ def run_model():
     # # Buffer Analysis
     buf_fc_list = ['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs', 'OSMP_Properties',
                    'avoid_points']
+    buf_distance = user_inputs['buf_distance']
+    # Output path of each buffer, joined once and reused by the intersect and clip.
+    buf_paths = {fc: set_path(output_db, f'{fc}_buf') for fc in buf_fc_list}
+    # The project is saved once after the intersect, if the model fails before then the layers that were
+    # already added are saved at exit.
+    atexit.register(aprx.save)
     for fc in buf_fc_list:
-        buf_distance = user_inputs['buf_distance']
-        input_fc_name = fc
-        buf_fc_name = f'{fc}_buf'
-        buf_fc = set_path(output_db, buf_fc_name)
-        buffer(mp, input_fc_name, buf_fc, buf_fc_name, buf_distance)
-        aprx.save()
+        buffer(mp, fc, buf_paths[fc], f'{fc}_buf', buf_distance)
 
     # Intersect Analysis
     # for loop is used to create intersect_fc_list for intersect function (including paths to output_db)
@@ -166,12 +144,12 @@ def run_model():
             arcpy.AddMessage(
                 '\nSkipping avoid_points for Intersect Analysis they will be used for Symmetrical Difference.\n')
         else:
-            intersect_fn = set_path(output_db, f'{fn}_buf')
-            intersect_fc_list.append(intersect_fn)
+            intersect_fc_list.append(buf_paths[fn])
     intersect_fc_name = user_inputs['intersect_fc']
     inter = set_path(output_db, intersect_fc_name)
     intersect(mp, intersect_fc_list, inter, intersect_fc_name)
     aprx.save()
+    atexit.unregister(aprx.save)
 
     # Query by Location
     join_output_name = 'IntersectAnalysis_Join_BoulderAddresses'
@@ -185,8 +163,8 @@ def run_model():
 
     # Clip (Analysis)
     # https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/clip.htm
-    inFeatures = set_path(output_db, 'avoid_points_buf')
-    clipFeatures = set_path(output_db, 'IntersectAnalysis')
+    inFeatures = buf_paths['avoid_points']
+    clipFeatures = inter
     clipOutput = set_path(output_db, 'clip_intersect')
 
     # Execute Clip
@@ -196,7 +174,7 @@ def run_model():
     # Record re-count
     join_output_name = 'clip_intersect_Join_BoulderAddresses'
     jofc = set_path(output_db, join_output_name)
-    sp = arcpy.SpatialJoin_analysis('Boulder_Addresses', set_path(output_db, 'clip_intersect'), jofc,
+    sp = arcpy.SpatialJoin_analysis('Boulder_Addresses', clipOutput, jofc,
                                     join_type="KEEP_COMMON", match_option="WITHIN")
     check_status(sp)
     record_count = arcpy.GetCount_management(jofc)
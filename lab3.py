@@ -1,87 +1,70 @@
-import time
+import functools
 import arcpy
 import etl
 import logging
-import tkinter as tk
+import gp_utils
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import config_dict, set_path, setup_logging
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
 def import_spatial_reference(dataset):
     r"""Extracts the spatial reference from input dataset.
 
+    Cached by dataset path, Describe is only run once per dataset.
+
     Arguments:
         dataset: Dataset with desired spatial reference.
     Returns:
         The spatial reference of any dataset input.
     """
     spatial_reference = arcpy.Describe(dataset).spatialReference
-    arcpy.AddMessage(f'spatial_reference: {spatial_reference.name}')
+    gp_utils.add_message(f'spatial_reference: {spatial_reference.name}')
     return spatial_reference
 
 
 def setup_env(workspace_path, spatial_ref_dataset):
     # Set workspace path.
     arcpy.env.workspace = workspace_path
-    arcpy.AddMessage('workspace(s): {}'.format(arcpy.env.workspace))
+    gp_utils.add_message('workspace(s): {}'.format(arcpy.env.workspace))
 
     # Set output overwrite option.
     arcpy.env.overwriteOutput = True
-    arcpy.AddMessage('overwriteOutput: {}'.format(arcpy.env.overwriteOutput))
+    gp_utils.add_message('overwriteOutput: {}'.format(arcpy.env.overwriteOutput))
 
     # Set the output spatial reference.
     arcpy.env.outputCoordinateSystem = import_spatial_reference(
         spatial_ref_dataset)
-    arcpy.AddMessage('outputCoordinateSystem: {}'.format(
+    gp_utils.add_message('outputCoordinateSystem: {}'.format(
         arcpy.env.outputCoordinateSystem.name))
 
 
 def check_status(result):
-    r"""Logs the status of executing geoprocessing tools.
-
-    Requires futher investigation to refactor this function:
-        I can not find geoprocessing tool name in the result object.
-        If the tool name can not be found may need to pass it in.
-        Return result.getMessages() needs more thought on what it does.
-
-    Understanding message types and severity:
-    https://pro.arcgis.com/en/pro-app/arcpy/geoprocessing_and_python/message-types-and-severity.htm
+    r"""Logs the status of executing geoprocessing tools, see gp_utils.check_status.
 
     Arguments:
         result: An executing geoprocessing tool object.
     Returns:
-        Requires futher investigation on what result.getMessages() means on return.
+        The result messages.
     """
-    status_code = dict([(0, 'New'), (1, 'Submitted'), (2, 'Waiting'),
-                        (3, 'Executing'), (4, 'Succeeded'), (5, 'Failed'),
-                        (6, 'Timed Out'), (7, 'Canceling'), (8, 'Canceled'),
-                        (9, 'Deleting'), (10, 'Deleted')])
-
-    arcpy.AddMessage('current job status: {0}-{1}'.format(
-        result.status, status_code[result.status]))
-    # Wait until the tool completes
-    while result.status < 4:
-        arcpy.AddMessage('current job status (in while loop): {0}-{1}'.format(
-            result.status, status_code[result.status]))
-        time.sleep(0.2)
-    messages = result.getMessages()
-    arcpy.AddMessage('job messages: {0}'.format(messages))
-    return messages
+    return gp_utils.check_status(result, message=gp_utils.msg)
 
 
 def arcgis_setup(flush_output_db=False):
     # Optional flush output_db
     output_db = config_dict.get('output_gdb_dir')
     if flush_output_db:
-        arcpy.AddMessage('\nFlushing Output DB')
+        gp_utils.add_message('\nFlushing Output DB')
         arcpy.env.workspace = output_db
-        arcpy.AddMessage(f'Contents of Output DB Before Flush {arcpy.ListFeatureClasses()}')
-        for fc in arcpy.ListFeatureClasses():
-            arcpy.AddMessage(f'Deleting: {fc}')
-            if arcpy.Exists(fc):
-                arcpy.Delete_management(fc)
-        arcpy.AddMessage(f'Contents of Output DB After Flush {arcpy.ListFeatureClasses()}\n')
+        # One catalog scan drives the delete, ListFeatureClasses only returns fcs that exist and None if the
+        # workspace is invalid.
+        fcs = arcpy.ListFeatureClasses() or []
+        if fcs:
+            arcpy.Delete_management(';'.join(fcs))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Flushed {fcs}, contents of Output DB after flush {arcpy.ListFeatureClasses()}')
     # Setup Geoprocessing Environment
     spatial_ref_dataset = config_dict.get('spatial_ref_dataset')
     input_db = config_dict.get('input_gdb_dir')
@@ -90,29 +73,46 @@ def arcgis_setup(flush_output_db=False):
 
 def run_etl():
     logger.debug('Starting Etl process.')
-    arcpy.AddMessage('Etl process starting...')
-    etl_instance = etl.GSheetsEtl(config_dict)
-    etl_instance.process()
+    gp_utils.add_message('Etl process starting...')
+    with etl.GSheetsEtl(config_dict) as etl_instance:
+        etl_instance.process()
     logger.debug('Etl process complete.')
 
 
 def get_map(aprx, map_name):
-    for mp in aprx.listMaps():
-        if map_name == mp.name:
-            arcpy.AddMessage(f'Map called {mp.name} found')
-            return mp
+    # listMaps filters by name instead of iterating every map in the project.
+    maps = aprx.listMaps(map_name)
+    if maps:
+        gp_utils.msg(f'Map called {maps[0].name} found')
+        return maps[0]
     raise ValueError(f'Map called {map_name} does not exist in current aprx {aprx.filePath}')
 
 
-def buffer(aprx_mp, input_fc, output_fc, lyr_name, buf_distance):
+def remove_layer(aprx_mp, layers_by_name, lyr_name):
+    r"""Removes a layer from a map if it exists.
+
+    Arguments:
+        aprx_mp: mp object from aprx.listMaps()
+        layers_by_name: dict of the map's layers by name, built once in run_model and kept up to date.
+        lyr_name: name of layer for the map
+    Returns:
+        N/A
+    """
+    lyr = layers_by_name.pop(lyr_name, None)
+    if lyr:
+        gp_utils.msg(f'layer {lyr_name} already exists, deleting {lyr_name} ...')
+        aprx_mp.removeLayer(lyr)
+
+
+def buffer(input_fc, output_fc, buf_distance):
     r"""Run ArcGIS Pro tool Buffer.
     https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/buffer.htm
 
+    Does not touch the map so it can run in a worker thread.
+
     Arguments:
-        aprx_mp: mp object from aprx.listMaps()
         input_fc: Required feature class to buffer.
         output_fc: Output buffered feature class.
-        lyr_name: name of layer for the map
         buf_distance: Distance to buffer the feature class.
     Returns:
         arcpy tool result object
@@ -120,11 +120,6 @@ def buffer(aprx_mp, input_fc, output_fc, lyr_name, buf_distance):
         N/A
     """
     logger.debug('Starting Buffer geoprocessing.')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            arcpy.AddMessage(f'layer {0} already exists, deleting {lyr_name} ...')
-            aprx_mp.removeLayer(lyr)
-            break
     buf = arcpy.Buffer_analysis(input_fc, output_fc, buf_distance, "FULL",
                                 "ROUND", "ALL")
     check_status(buf)
@@ -133,9 +128,9 @@ def buffer(aprx_mp, input_fc, output_fc, lyr_name, buf_distance):
     logger.debug('Buffer geoprocessing complete.')
 
 
-def intersect(aprx_mp, fc_list, output_fc, lyr_name):
-    r"""Run ArcGIS Pro tool Intersect.
-    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/intersect.htm
+def intersect(fc_list, output_fc):
+    r"""Run ArcGIS Pro tool Pairwise Intersect, multithreaded alternative to Intersect.
+    https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/pairwise-intersect.htm
 
     Arguments:
         fc_list: List of feature classes to run Intersect Analysis on.
@@ -146,74 +141,66 @@ def intersect(aprx_mp, fc_list, output_fc, lyr_name):
         N/A
     """
     logger.debug('Starting Intersect geoprocessing.')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            arcpy.AddMessage(f'layer {lyr_name} already exists, deleting {lyr_name} ...')
-            aprx_mp.removeLayer(lyr)
-            break
-    inter = arcpy.Intersect_analysis(fc_list, output_fc, "ALL")
+    inter = arcpy.analysis.PairwiseIntersect(fc_list, output_fc, "ALL")
     check_status(inter)
     # lyr = arcpy.MakeFeatureLayer_management(output_fc, lyr_name)
     # aprx_mp.addLayer(lyr[0], 'TOP')
     logger.debug('Intersect geoprocessing complete.')
 
 
-def add_feature_to_map(aprx_mp, lyr_name, output_fc, colour):
+def add_feature_to_map(aprx_mp, layers_by_name, lyr_name, output_fc, colour):
     logger.debug('Adding feature to map.')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            arcpy.AddMessage(f'layer {0} already exists, deleting {lyr_name} ...')
-            aprx_mp.removeLayer(lyr)
-            break
+    remove_layer(aprx_mp, layers_by_name, lyr_name)
     lyr = arcpy.MakeFeatureLayer_management(output_fc, lyr_name)
     aprx_mp.addLayer(lyr[0], 'TOP')
-    for lyr in aprx_mp.listLayers():
-        if lyr.name == lyr_name:
-            sym = lyr.symbology
-            sym.renderer.symbol.color = {'RGB': colour}
-            lyr.symbology = sym
+    lyr = aprx_mp.listLayers(lyr_name)[0]
+    layers_by_name[lyr_name] = lyr
+    sym = lyr.symbology
+    sym.renderer.symbol.color = {'RGB': colour}
+    lyr.symbology = sym
     logger.debug('Add feature to map complete.')
 
 
-def export_map(subtitle):
+def export_map(aprx, subtitle):
     logger.debug('Starting map export.')
-    # Setup aprx
-    aprx_path = set_path(config_dict.get('proj_dir'), 'WestNileOutbreak.aprx')
-    aprx = arcpy.mp.ArcGISProject(aprx_path)
     lyt = aprx.listLayouts()[0]
-    for el in lyt.listElements():
-        arcpy.AddMessage(el.name)
-        if 'Title' in el.name:
-            el.text = f'{el.text} {subtitle}'
-            arcpy.AddMessage(el.text)
-    aprx.save()
+    # listElements filters by type and name, only the title text elements are returned.
+    for el in lyt.listElements('TEXT_ELEMENT', '*Title*'):
+        el.text = f'{el.text} {subtitle}'
+        gp_utils.msg(el.text)
     lyt.exportToPDF(f'{config_dict["proj_dir"]}/wnv.pdf')
     logger.debug('Export map complete.')
 
 
 def input_gui():
     logger.debug('Starting input gui.')
+    # Imported here so Tcl/Tk is only loaded when the gui is shown.
+    import tkinter as tk
+
     user_inputs = None
 
+    # Input key and label of each row, all widgets are created before the first geometry pass.
+    fields = [('intersect_fc', 'Intersect feature class name, example: IntersectAnalysis'),
+              ('buf_distance', 'Buffer distance, example: 2500 Feet'),
+              ('map_subtitle', 'Map subtitle, example: 2500 Feet')]
+    entries = {}
+
     def get_inputs():
         nonlocal user_inputs
-        user_inputs = {'intersect_fc': p1.get(), 'buf_distance': p2.get(), 'map_subtitle': p3.get()}
+        user_inputs = {key: entry.get() for key, entry in entries.items()}
 
     gui = tk.Tk()
     gui.wm_title('West Nile Virus Simulation Inputs')
-    tk.Label(gui, text='Intersect feature class name, example: IntersectAnalysis').grid(sticky=tk.W, row=0)
-    p1 = tk.Entry(gui)
-    p1.grid(row=0, column=1)
-    tk.Label(gui, text='Buffer distance, example: 2500 Feet').grid(sticky=tk.W, row=1)
-    p2 = tk.Entry(gui)
-    p2.grid(row=1, column=1)
-    tk.Label(gui, text='Map subtitle, example: 2500 Feet').grid(sticky=tk.W, row=2)
-    p3 = tk.Entry(gui)
-    p3.grid(row=2, column=1)
-    tk.Button(gui, text='Submit', command=get_inputs).grid(row=3, column=0, sticky=tk.W, pady=4)
+    for row, (key, text) in enumerate(fields):
+        tk.Label(gui, text=text).grid(sticky=tk.W, row=row)
+        entries[key] = tk.Entry(gui)
+        entries[key].grid(row=row, column=1)
+    tk.Button(gui, text='Submit', command=get_inputs).grid(row=len(fields), column=0, sticky=tk.W, pady=4)
     # Quit button hangs while program completes then gui crashes, workaround: close the window after inputs.
     # tk.Button(gui, text='Quit', command=gui.quit).grid(row=3, column=1, sticky=tk.W, pady=4)
-    gui.mainloop()
+    # Lay out once then block until the window is closed.
+    gui.update_idletasks()
+    gui.wait_window()
 
     logger.debug('Input gui complete.')
 
@@ -221,8 +208,13 @@ def input_gui():
 
 
 def run_model():
+    # Config values used throughout the model, looked up once.
+    output_db = config_dict['output_gdb_dir']
+    proj_dir = config_dict['proj_dir']
+    log_fn = config_dict['log_fn']
+
     # setup the logger to generate log file use commands: logger.debug(msg), logger.info(msg)
-    setup_logging(level='DEBUG', fn=f'{config_dict["proj_dir"]}/{config_dict["log_fn"]}')
+    setup_logging(level='DEBUG', fn=f'{proj_dir}/{log_fn}')
 
     # Start Input GUI
     user_inputs = input_gui()
@@ -230,38 +222,42 @@ def run_model():
     logger.info(f'Simulation Parameters: {user_inputs}')
 
     # setup arcpy environment
-    output_db = config_dict.get('output_gdb_dir')
-    arcpy.AddMessage(f'output db: {output_db}')
-    aprx_path = set_path(config_dict.get('proj_dir'), 'WestNileOutbreak.aprx')
+    gp_utils.add_message(f'output db: {output_db}')
+    aprx_path = set_path(proj_dir, 'WestNileOutbreak.aprx')
     aprx = arcpy.mp.ArcGISProject(aprx_path)
-    arcpy.AddMessage(f'aprx path: {aprx.filePath}')
+    gp_utils.add_message(f'aprx path: {aprx.filePath}')
     mp = get_map(aprx, 'Map')
+    # Layers by name, scanned once instead of once per layer lookup.
+    layers_by_name = {lyr.name: lyr for lyr in mp.listLayers()}
 
     # Buffer Analysis
     buf_fc_list = ['Mosquito_Larval_Sites', 'Wetlands_Regulatory', 'Lakes_and_Reservoirs', 'OSMP_Properties',
                    'avoid_points']
+    # The buffers are independent, arcpy releases the GIL while a tool runs so they run in parallel threads.
+    # Outputs are replaced with overwriteOutput, which does not touch map layers. lab2 adds a *_buf layer for every
+    # buffer to the same map, they are removed here so no layer is left pointing at a flushed or in memory fc.
+    # The intersect inputs are only read by Intersect so they are kept in the memory workspace instead of written to
+    # the output db, avoid_points_buf is still needed on disk for the clip and the map.
+    buf_paths = {fc: set_path(output_db, f'{fc}_buf') if fc == 'avoid_points' else f'memory/{fc}_buf'
+                 for fc in buf_fc_list}
+    buf_distance = user_inputs['buf_distance']
     for fc in buf_fc_list:
-        buf_distance = user_inputs['buf_distance']
-        input_fc_name = fc
-        buf_fc_name = f'{fc}_buf'
-        buf_fc = set_path(output_db, buf_fc_name)
-        buffer(mp, input_fc_name, buf_fc, buf_fc_name, buf_distance)
-        aprx.save()
+        remove_layer(mp, layers_by_name, f'{fc}_buf')
+    with ThreadPoolExecutor(max_workers=len(buf_fc_list)) as executor:
+        futures = [executor.submit(buffer, fc, buf_paths[fc], buf_distance) for fc in buf_fc_list]
+        for future in as_completed(futures):
+            future.result()
 
     # Intersect Analysis
-    # for loop is used to create intersect_fc_list for intersect function (including paths to output_db)
-    intersect_fc_list = []
-    for fn in buf_fc_list:
-        if fn == 'avoid_points':
-            arcpy.AddMessage(
-                '\nSkipping avoid_points for Intersect Analysis they will be used for Symmetrical Difference.\n')
-        else:
-            intersect_fn = set_path(output_db, f'{fn}_buf')
-            intersect_fc_list.append(intersect_fn)
+    # intersect_fc_list is the in memory buffer paths, avoid_points is skipped
+    gp_utils.add_message(
+        '\nSkipping avoid_points for Intersect Analysis they will be used for Symmetrical Difference.\n')
+    intersect_fc_list = [buf_paths[fn] for fn in buf_fc_list if fn != 'avoid_points']
     intersect_fc_name = user_inputs['intersect_fc']
     inter = set_path(output_db, intersect_fc_name)
-    intersect(mp, intersect_fc_list, inter, intersect_fc_name)
-    aprx.save()
+    intersect(intersect_fc_list, inter)
+    # Free the in memory buffers.
+    arcpy.Delete_management(intersect_fc_list)
 
     # Query by Location
     logger.debug('Starting Spatial Join geoprocessing.')
@@ -274,14 +270,14 @@ def run_model():
     # Record Count
     logger.debug('Starting Get Count geoprocessing.')
     record_count = arcpy.GetCount_management(jofc)
-    arcpy.AddMessage(f'\nBoulder Addresses at-risk =  {record_count[0]}\n')
+    gp_utils.add_message(f'\nBoulder Addresses at-risk =  {record_count[0]}\n')
     logger.debug('Get Count geoprocessing complete.')
 
     # Clip (Analysis)
     # https://pro.arcgis.com/en/pro-app/latest/tool-reference/analysis/clip.htm
     logger.debug('Starting Clip geoprocessing.')
-    inFeatures = set_path(output_db, 'avoid_points_buf')
-    clipFeatures = set_path(output_db, user_inputs['intersect_fc'])
+    inFeatures = buf_paths['avoid_points']
+    clipFeatures = inter
     clipOutput = set_path(output_db, 'clip_intersect')
 
     # Execute Clip
@@ -293,29 +289,33 @@ def run_model():
     logger.debug('Starting Spatial Join geoprocessing.')
     join_output_name = 'clip_intersect_Join_BoulderAddresses'
     jofc = set_path(output_db, join_output_name)
-    sp = arcpy.SpatialJoin_analysis('Boulder_Addresses', set_path(output_db, 'clip_intersect'), jofc,
+    sp = arcpy.SpatialJoin_analysis('Boulder_Addresses', clipOutput, jofc,
                                     join_type="KEEP_COMMON", match_option="WITHIN")
     check_status(sp)
     logger.debug('Spatial Join geoprocessing complete.')
-    logger.debug('Starting Get Count geoprocessing.')
-    record_count = arcpy.GetCount_management(jofc)
-    logger.debug('Get Count geoprocessing complete.')
-    arcpy.AddMessage(
-        f'\nBoulder Addresses in risk zone that need to be opted out of pesticide spraying =  {record_count[0]}\n')
 
-    # Add desired features to output map and colour the features
-    map_features = [(user_inputs['intersect_fc'], [255, 235, 190, 100]),
-                    ('avoid_points_buf', [115, 178, 255, 100]),
-                    ('clip_intersect_Join_BoulderAddresses', [102, 119, 205, 100])]
-    for f, c in map_features:
-        fc_name = f
-        fc = set_path(output_db, f)
-        colour = c
-        add_feature_to_map(mp, fc_name, fc, colour)
-    aprx.save()
+    # The count is not used by the map, get it in the background while the map features are added.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        logger.debug('Starting Get Count geoprocessing.')
+        record_count = executor.submit(arcpy.GetCount_management, jofc)
+
+        # Add desired features to output map and colour the features
+        map_features = [(user_inputs['intersect_fc'], [255, 235, 190, 100]),
+                        ('avoid_points_buf', [115, 178, 255, 100]),
+                        ('clip_intersect_Join_BoulderAddresses', [102, 119, 205, 100])]
+        for f, c in map_features:
+            fc_name = f
+            fc = set_path(output_db, f)
+            colour = c
+            add_feature_to_map(mp, layers_by_name, fc_name, fc, colour)
+
+        record_count = record_count.result()
+        logger.debug('Get Count geoprocessing complete.')
+    gp_utils.add_message(
+        f'\nBoulder Addresses in risk zone that need to be opted out of pesticide spraying =  {record_count[0]}\n')
 
-    # Export final map
-    export_map(user_inputs['map_subtitle'])
+    # Export final map, the open project is exported and saved once.
+    export_map(aprx, user_inputs['map_subtitle'])
     aprx.save()
 
 